@@ -8,6 +8,7 @@
 на адрес вашего сервера, например: http://192.168.1.100:11434/v1
 """
 
+import functools
 import logging
 import os
 
@@ -36,6 +37,27 @@ SCORM_VERSION = "1.2"
 SCORM_SCHEMA_VERSION = "1.2"
 SCORM_DEFAULT_ORG = "default-org"
 SCORM_MASTERY_SCORE = 80  # Проходной балл (%)
+SCORM_EMIT_LEGACY_INDEX = False  # Класть общий index.html в Multi-SCO пакет
+
+
+def _compresslevel_from_env() -> int | None:
+    """SCORM_COMPRESSLEVEL из окружения: 1-9, иначе None (дефолт zlib)."""
+    raw = os.getenv("SCORM_COMPRESSLEVEL", "").strip()
+    if not raw:
+        return None
+    try:
+        level = int(raw)
+    except ValueError:
+        level = None
+    if level is None or not 1 <= level <= 9:
+        logger.warning("SCORM_COMPRESSLEVEL=%r — ожидается 1-9, используется "
+                       "уровень по умолчанию", raw)
+        return None
+    return level
+
+
+# Уровень deflate 1-9 для ZIP (пусто или неверно — дефолт zlib, 6)
+SCORM_COMPRESSLEVEL = _compresslevel_from_env()
 
 # ==============================
 # Course Defaults
@@ -59,15 +81,39 @@ CHAMILO_PASSWORD = os.getenv("CHAMILO_PASSWORD", "")
 CHAMILO_API_KEY = os.getenv("CHAMILO_API_KEY", "")
 
 
+# ==============================
+# Web UI
+# ==============================
+GENERATE_WORKERS = int(os.getenv("GENERATE_WORKERS", "2"))  # Параллельных генераций
+# Одновременных SSE-потоков прогресса: каждый занимает поток gunicorn,
+# держите заметно меньше WEB_THREADS; сверх лимита клиент опрашивает статус
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "4"))
+# Префикс internal-location nginx для отдачи ZIP через X-Accel-Redirect
+# (например "/_scorm/"); пусто — файл отдаёт сам Flask
+SCORM_ACCEL_REDIRECT = os.getenv("SCORM_ACCEL_REDIRECT", "")
+# Apache mod_xsendfile / lighttpd: send_file отвечает заголовком X-Sendfile
+USE_X_SENDFILE = os.getenv("USE_X_SENDFILE", "").lower() in ("1", "true", "yes")
+
+
 # ==============================
 # Thread-safe config reload (#3)
 # ==============================
-def get_config() -> dict:
-    """Потокобезопасное перечитывание конфигурации из .env.
+_config_version = 0
+_ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
 
-    Вместо importlib.reload(config) каждый вызов создаёт
-    новый dict с актуальными значениями из .env файла.
-    """
+
+def _env_stamp() -> tuple:
+    """(mtime_ns, size) файла .env — меняется при ручной правке файла."""
+    try:
+        st = os.stat(_ENV_PATH)
+    except OSError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=1)
+def _load_config(version: int, env_stamp: tuple) -> dict:
+    """Чтение .env и сборка dict конфигурации (кэшируется по версии и mtime .env)."""
     try:
         from dotenv import load_dotenv as _load
         _load(override=True)
@@ -85,3 +131,21 @@ def get_config() -> dict:
         "CHAMILO_PASSWORD": os.getenv("CHAMILO_PASSWORD", ""),
         "CHAMILO_API_KEY": os.getenv("CHAMILO_API_KEY", ""),
     }
+
+
+def get_config() -> dict:
+    """Потокобезопасное получение конфигурации из .env.
+
+    Вместо importlib.reload(config) возвращает dict с актуальными
+    значениями. .env перечитывается только после bump_version() или
+    при изменении mtime/размера файла (один stat() на вызов);
+    между вызовами возвращается один и тот же dict — не изменяйте его.
+    """
+    return _load_config(_config_version, _env_stamp())
+
+
+def bump_version() -> None:
+    """Сбросить кэш get_config() — вызывать после изменения .env."""
+    global _config_version
+    _config_version += 1
+    _load_config.cache_clear()
@@ -0,0 +1,19 @@
+"""
+Конфигурация gunicorn для Web интерфейса.
+
+Запуск:
+    gunicorn -c gunicorn_conf.py wsgi:app
+"""
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+
+# Задачи генерации и SSE-подписчики живут в памяти процесса —
+# воркер один, параллелизм за счёт потоков
+workers = 1
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+
+# Проверка Chamilo/LLM и загрузка SCORM могут идти десятки секунд
+timeout = 120
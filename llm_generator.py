@@ -49,12 +49,48 @@ import json
 import logging
 import os
 import re
+import threading
 import time
 
 import config
+from scorm_builder import SCORMBuilder
 
 logger = logging.getLogger(__name__)
 
+# Общие OpenAI клиенты: (base_url, хэш ключа) -> OpenAI.
+# Клиент держит httpx-пул — соединения и TLS переиспользуются между запросами
+_clients: dict = {}
+_clients_lock = threading.Lock()
+_CLIENTS_MAX = 8
+
+# Кэш сгенерированных курсов: OUTPUT_DIR/<_CACHE_SUBDIR>/cache_<key>.json
+_CACHE_SUBDIR = ".course_cache"
+_CACHE_MAX_ENTRIES = 100
+
+
+def get_openai_client(api_key: str, base_url: str | None = None):
+    """OpenAI клиент, общий для одинаковых (base_url, api_key).
+
+    Ключ хранится в кэше только в виде хэша.
+    """
+    key = (base_url, hashlib.blake2b(api_key.encode(), digest_size=16).hexdigest())
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+
+        from openai import OpenAI
+
+        kwargs = {"api_key": api_key}
+        if base_url:
+            kwargs["base_url"] = base_url
+        client = OpenAI(**kwargs)
+
+        _clients[key] = client
+        if len(_clients) > _CLIENTS_MAX:
+            del _clients[next(iter(_clients))]
+        return client
+
 
 class LLMCourseGenerator:
     """Генератор JSON-структуры курса."""
@@ -78,17 +114,12 @@ class LLMCourseGenerator:
     def client(self):
         """Ленивая инициализация OpenAI клиента — переиспользуется."""
         if self._client is None:
-            from openai import OpenAI
-
-            kwargs = {}
             if self.base_url:
-                kwargs["base_url"] = self.base_url
-                kwargs["api_key"] = self.api_key or "local"
                 logger.info("LLM server: %s", self.base_url)
+                self._client = get_openai_client(self.api_key or "local",
+                                                 self.base_url)
             else:
-                kwargs["api_key"] = self.api_key
-
-            self._client = OpenAI(**kwargs)
+                self._client = get_openai_client(self.api_key)
         return self._client
 
     # ------------------------------------------------------------------
@@ -187,19 +218,25 @@ class LLMCourseGenerator:
             )
 
     def generate_course_cached(self, topic: str, num_pages: int | None = None,
-                               language: str | None = None, **kwargs) -> dict:
+                               language: str | None = None, *,
+                               read_cache: bool = True, **kwargs) -> dict:
         """Генерация курса с кэшированием (#6).
 
         Если курс с такими же параметрами уже генерировался,
-        возвращает результат из кэша.
+        возвращает результат из кэша. read_cache=False — всегда генерировать
+        заново, но результат всё равно сохранить в кэш.
         """
         num_pages = num_pages or config.DEFAULT_NUM_PAGES
         language = language or config.DEFAULT_COURSE_LANGUAGE
 
-        key = self._cache_key(topic, num_pages, language, **kwargs)
-        cache_path = os.path.join(config.OUTPUT_DIR, f"cache_{key}.json")
+        # Модель и сервер входят в ключ — курс другой модели не из кэша
+        key = self._cache_key(topic, num_pages, language, model=self.model,
+                              base_url=self.base_url, **kwargs)
+        # Отдельный подкаталог: /api/download отдаёт только файлы из OUTPUT_DIR
+        cache_dir = os.path.join(config.OUTPUT_DIR, _CACHE_SUBDIR)
+        cache_path = os.path.join(cache_dir, f"cache_{key}.json")
 
-        if os.path.isfile(cache_path):
+        if read_cache and os.path.isfile(cache_path):
             logger.info("Using cached course: %s", cache_path)
             with open(cache_path, "r", encoding="utf-8") as f:
                 return json.load(f)
@@ -208,14 +245,35 @@ class LLMCourseGenerator:
             topic=topic, num_pages=num_pages, language=language, **kwargs
         )
 
-        # Save to cache
-        os.makedirs(config.OUTPUT_DIR, exist_ok=True)
-        with open(cache_path, "w", encoding="utf-8") as f:
+        # Save to cache (через временный файл — параллельный читатель
+        # не увидит недописанный JSON)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(course, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, cache_path)
         logger.info("Course cached: %s", cache_path)
+        self._trim_cache(cache_dir)
 
         return course
 
+    @staticmethod
+    def _trim_cache(cache_dir: str) -> None:
+        """Оставить в кэше не более _CACHE_MAX_ENTRIES самых свежих курсов."""
+        try:
+            entries = [e for e in os.scandir(cache_dir)
+                       if e.is_file() and e.name.endswith(".json")]
+        except OSError:
+            return
+        if len(entries) <= _CACHE_MAX_ENTRIES:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        for entry in entries[_CACHE_MAX_ENTRIES:]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass  # уже удалён параллельной генерацией
+
     @staticmethod
     def generate_from_file(path: str) -> dict:
         """Загрузка готовой JSON-структуры курса из файла.
@@ -419,24 +477,9 @@ class LLMCourseGenerator:
 
     @staticmethod
     def _slugify(text: str) -> str:
-        """Простая транслитерация и slugify для идентификаторов."""
-        translit = {
-            "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e",
-            "ё": "yo", "ж": "zh", "з": "z", "и": "i", "й": "j", "к": "k",
-            "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
-            "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
-            "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y",
-            "ь": "", "э": "e", "ю": "yu", "я": "ya",
-        }
-        result = []
-        for char in text.lower():
-            if char in translit:
-                result.append(translit[char])
-            elif char.isascii() and (char.isalnum() or char in "-_"):
-                result.append(char)
-            elif char in " \t":
-                result.append("-")
-        slug = "".join(result)
-        # Collapse multiple hyphens (#9 — re.sub instead of while loop)
-        slug = re.sub(r'-{2,}', '-', slug)
-        return slug.strip("-") or "course"
+        """Простая транслитерация и slugify для идентификаторов.
+
+        Делегирует SCORMBuilder._slugify, чтобы slug курса совпадал
+        с идентификатором манифеста и именем ZIP.
+        """
+        return SCORMBuilder._slugify(text)
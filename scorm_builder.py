@@ -3,7 +3,9 @@ SCORM 1.2 Builder — генерация SCORM-пакета из JSON-струк
 
 Создаёт ZIP-архив, содержащий:
 - imsmanifest.xml  — манифест SCORM 1.2
-- index.html       — HTML-страница курса (из Jinja2 шаблона)
+- page_N.html      — HTML-страница на каждый SCO (из Jinja2 шаблона)
+- index.html       — общий HTML курса (только для пустого курса или
+                     при config.SCORM_EMIT_LEGACY_INDEX)
 - style.css        — стили
 - scorm_api.js     — JS-обёртка SCORM API
 """
@@ -11,10 +13,16 @@ SCORM 1.2 Builder — генерация SCORM-пакета из JSON-струк
 import logging
 import os
 import re
+import uuid
 import zipfile
 import xml.etree.ElementTree as ET
+from collections.abc import Iterable
+from typing import IO
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import (
+    Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateNotFound,
+)
+from jinja2.environment import TemplateStream
 
 import config
 
@@ -23,35 +31,114 @@ logger = logging.getLogger(__name__)
 # Jinja2 Environment cache (#11)
 _env_cache: dict[str, Environment] = {}
 
+# Таблица транслитерации для _slugify (строится один раз при импорте)
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e",
+    "ё": "yo", "ж": "zh", "з": "z", "и": "i", "й": "j", "к": "k",
+    "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y",
+    "ь": "", "э": "e", "ю": "yu", "я": "ya",
+}
+_SLUG_TABLE = str.maketrans({**_TRANSLIT, " ": "-", "\t": "-"})
+_SLUG_BAD_RE = re.compile(r'[^a-z0-9_-]+')
+_DASH_RE = re.compile(r'-{2,}')
+
+
+# Пространства имён и schemaLocation манифеста SCORM 1.2
+_NSMAP = {
+    "": "http://www.imsproject.org/xsd/imscp_rootv1p1p2",
+    "adlcp": "http://www.adlnet.org/xsd/adlcp_rootv1p2",
+    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
+}
+_SCHEMA_LOCATION = (
+    "http://www.imsproject.org/xsd/imscp_rootv1p1p2 "
+    "imscp_rootv1p1p2.xsd "
+    "http://www.adlnet.org/xsd/adlcp_rootv1p2 "
+    "adlcp_rootv1p2.xsd"
+)
+
+# Фиксированная дата записей ZIP — одинаковый курс даёт побайтно
+# одинаковый пакет
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# Сколько фрагментов шаблона склеивать перед записью в ZIP
+_TEMPLATE_BUFFER_SIZE = 64
+
+# Кэш статических файлов: path -> (mtime_ns, size, bytes)
+_static_cache: dict[str, tuple[int, int, bytes]] = {}
+
+
+def _load_static(path: str) -> bytes:
+    """Статический файл шаблона как bytes.
+
+    Перечитывается с диска только если изменились mtime или размер.
+    """
+    st = os.stat(path)
+    cached = _static_cache.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+
+    with open(path, "rb") as f:
+        data = f.read()
+    _static_cache[path] = (st.st_mtime_ns, st.st_size, data)
+    return data
+
 
 class SCORMBuilder:
     """Генератор SCORM 1.2 пакетов."""
 
-    def __init__(self, templates_dir: str | None = None):
+    def __init__(self, templates_dir: str | None = None,
+                 compression: int = zipfile.ZIP_DEFLATED,
+                 compresslevel: int | None = None):
         self.templates_dir = templates_dir or config.TEMPLATES_DIR
+        # Метод сжатия ZIP (ZIP_STORED — без сжатия, для быстрых сборок)
+        self._compression = compression
+        # Уровень deflate: 1 — быстрее сборка, архив немного больше;
+        # None — config.SCORM_COMPRESSLEVEL, затем дефолт zlib (6)
+        if compresslevel is None:
+            compresslevel = config.SCORM_COMPRESSLEVEL
+        self._compresslevel = compresslevel
 
         # Cache Environment per templates_dir (#11)
         if self.templates_dir not in _env_cache:
             _env_cache[self.templates_dir] = Environment(
                 loader=FileSystemLoader(self.templates_dir),
                 autoescape=False,
+                # Скомпилированные шаблоны переживают перезапуск процесса (CLI).
+                # Без каталога Jinja берёт личный _jinja2-cache-<uid> (0700,
+                # с проверкой владельца) — чужой кэш не исполняется
+                bytecode_cache=FileSystemBytecodeCache(),
+                auto_reload=False,
             )
         self.env = _env_cache[self.templates_dir]
 
+        # Шаблоны резолвятся один раз, а не на каждый рендер
+        self._tpl_index = self.env.get_template("index.html")
+        # page.html опционален — если его нет, фоллбэк на index.html
+        try:
+            self._tpl_page = self.env.get_template("page.html")
+            self._has_page_tpl = True
+        except TemplateNotFound:
+            self._tpl_page = None
+            self._has_page_tpl = False
+
     # ------------------------------------------------------------------
     # Публичные методы
     # ------------------------------------------------------------------
 
-    def build(self, course: dict, output_path: str | None = None) -> str:
+    def build(self, course: dict,
+              output_path: str | os.PathLike | IO[bytes] | None = None,
+              ) -> str | os.PathLike | IO[bytes]:
         """Сборка SCORM-пакета.
 
         Args:
             course: JSON-структура курса (из LLMCourseGenerator).
-            output_path: Путь для сохранения ZIP. Если не задан —
+            output_path: Путь для сохранения ZIP или бинарный поток
+                         (например io.BytesIO). Если не задан —
                          используется output/<slug>.zip.
 
         Returns:
-            str — путь к созданному ZIP-файлу.
+            Путь к созданному ZIP-файлу (или переданный поток).
         """
         title = course.get("title", "Untitled Course")
         slug = self._slugify(title)
@@ -60,69 +147,83 @@ class SCORMBuilder:
             os.makedirs(config.OUTPUT_DIR, exist_ok=True)
             output_path = os.path.join(config.OUTPUT_DIR, f"{slug}.zip")
 
-        manifest_xml = self._generate_manifest(course)
+        if isinstance(output_path, (str, os.PathLike)):
+            self._build_to_file(course, output_path)
+        else:
+            with self._open_zip(output_path) as zf:
+                self._write_package(zf, course)
 
-        # Чтение статических файлов
-        style_css = self._read_template_file("style.css")
-        scorm_js = self._read_template_file("scorm_api.js")
+        logger.info("SCORM package created: %s", output_path)
+        return output_path
 
-        # Упаковка в ZIP
-        files = {
-            "imsmanifest.xml": manifest_xml,
-            "style.css": style_css,
-            "scorm_api.js": scorm_js,
-        }
-        
-        # Добавляем страницы (Multi-SCO)
+    def _build_to_file(self, course: dict, output_path: str | os.PathLike) -> None:
+        """Атомарная запись: пакет собирается во временный файл рядом и
+        заменяет output_path только целиком — при ошибке рендера прежний
+        ZIP остаётся нетронутым, параллельные сборки не пишут в один файл.
+        """
+        output_path = os.path.abspath(output_path)
+        out_dir, name = os.path.split(output_path)
+        os.makedirs(out_dir, exist_ok=True)
+        tmp_path = os.path.join(out_dir, f".{name}.{uuid.uuid4().hex}.tmp")
+
+        try:
+            with open(tmp_path, "xb") as f, self._open_zip(f) as zf:
+                self._write_package(zf, course)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _write_package(self, zf: zipfile.ZipFile, course: dict) -> None:
+        """Запись всех файлов пакета в открытый ZIP."""
         pages = course.get("pages", [])
+
+        # Один проход: каждый файл пишется в ZIP сразу после рендера,
+        # без промежуточного словаря {filename: content}
+        self._write_chunks(zf, "imsmanifest.xml",
+                           self._generate_manifest(course))
+        zf.writestr(self._zip_info(zf, "style.css"),
+                    self._read_template_file("style.css"))
+        zf.writestr(self._zip_info(zf, "scorm_api.js"),
+                    self._read_template_file("scorm_api.js"))
+
+        # Добавляем страницы (Multi-SCO)
         if not pages:
             # Fallback для пустого курса
-            files["index.html"] = self._render_html(course)
+            self._write_html(zf, "index.html", self._render_html(course))
         else:
             for page_idx, page in enumerate(pages):
-                html_content = self._render_page_html(course, page, page_idx)
-                files[f"page_{page_idx + 1}.html"] = html_content
-                
-            # Сохраняем и общий index.html на случай, если кто-то запустит напрямую
-            files["index.html"] = self._render_html(course)
+                self._write_html(zf, f"page_{page_idx + 1}.html",
+                                 self._render_page_html(course, page, page_idx))
 
-        self._create_zip(files, output_path)
-
-        logger.info("SCORM package created: %s", output_path)
-        return output_path
+            # Общий index.html не входит в манифест — только по запросу
+            if config.SCORM_EMIT_LEGACY_INDEX:
+                self._write_html(zf, "index.html", self._render_html(course))
 
     # ------------------------------------------------------------------
     # Генерация imsmanifest.xml (#10 — ET.indent instead of minidom)
     # ------------------------------------------------------------------
 
-    def _generate_manifest(self, course: dict) -> str:
-        """Генерация SCORM 1.2 imsmanifest.xml."""
+    def _generate_manifest(self, course: dict) -> list[bytes]:
+        """Генерация SCORM 1.2 imsmanifest.xml (куски UTF-8 для записи в ZIP)."""
 
         title = course.get("title", "Untitled Course")
         description = course.get("description", "")
         identifier = self._slugify(title)
-
-        # Namespace map
-        nsmap = {
-            "": "http://www.imsproject.org/xsd/imscp_rootv1p1p2",
-            "adlcp": "http://www.adlnet.org/xsd/adlcp_rootv1p2",
-            "xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        }
+        mastery_val = str(config.SCORM_MASTERY_SCORE)
 
         # Build XML manually for proper namespace handling
-        manifest = ET.Element("manifest")
-        manifest.set("identifier", identifier)
-        manifest.set("version", "1.0")
-        manifest.set("xmlns", nsmap[""])
-        manifest.set("xmlns:adlcp", nsmap["adlcp"])
-        manifest.set("xmlns:xsi", nsmap["xsi"])
-        manifest.set(
-            "xsi:schemaLocation",
-            "http://www.imsproject.org/xsd/imscp_rootv1p1p2 "
-            "imscp_rootv1p1p2.xsd "
-            "http://www.adlnet.org/xsd/adlcp_rootv1p2 "
-            "adlcp_rootv1p2.xsd",
-        )
+        manifest = ET.Element("manifest", {
+            "identifier": identifier,
+            "version": "1.0",
+            "xmlns": _NSMAP[""],
+            "xmlns:adlcp": _NSMAP["adlcp"],
+            "xmlns:xsi": _NSMAP["xsi"],
+            "xsi:schemaLocation": _SCHEMA_LOCATION,
+        })
 
         # Metadata
         metadata = ET.SubElement(manifest, "metadata")
@@ -132,11 +233,13 @@ class SCORMBuilder:
         schema_ver.text = config.SCORM_SCHEMA_VERSION
 
         # Organizations
-        organizations = ET.SubElement(manifest, "organizations")
-        organizations.set("default", config.SCORM_DEFAULT_ORG)
+        organizations = ET.SubElement(
+            manifest, "organizations", {"default": config.SCORM_DEFAULT_ORG}
+        )
 
-        org = ET.SubElement(organizations, "organization")
-        org.set("identifier", config.SCORM_DEFAULT_ORG)
+        org = ET.SubElement(
+            organizations, "organization", {"identifier": config.SCORM_DEFAULT_ORG}
+        )
 
         org_title = ET.SubElement(org, "title")
         org_title.text = title
@@ -145,27 +248,28 @@ class SCORMBuilder:
         pages = course.get("pages", [])
         if not pages:
             # Empty course fallback
-            item = ET.SubElement(org, "item")
-            item.set("identifier", "item-1")
-            item.set("identifierref", "resource-1")
-            item.set("isvisible", "true")
-            
+            item = ET.SubElement(org, "item", {
+                "identifier": "item-1",
+                "identifierref": "resource-1",
+                "isvisible": "true",
+            })
+
             item_title = ET.SubElement(item, "title")
             item_title.text = title
             
             mastery = ET.SubElement(item, "adlcp:masteryscore")
-            mastery.text = str(config.SCORM_MASTERY_SCORE)
+            mastery.text = mastery_val
 
             resources = ET.SubElement(manifest, "resources")
-            resource = ET.SubElement(resources, "resource")
-            resource.set("identifier", "resource-1")
-            resource.set("type", "webcontent")
-            resource.set("adlcp:scormtype", "sco")
-            resource.set("href", "index.html")
+            resource = ET.SubElement(resources, "resource", {
+                "identifier": "resource-1",
+                "type": "webcontent",
+                "adlcp:scormtype": "sco",
+                "href": "index.html",
+            })
 
             for fname in ["index.html", "style.css", "scorm_api.js"]:
-                f = ET.SubElement(resource, "file")
-                f.set("href", fname)
+                ET.SubElement(resource, "file", {"href": fname})
         else:
             resources = ET.SubElement(manifest, "resources")
             for page_idx, page in enumerate(pages):
@@ -173,60 +277,57 @@ class SCORMBuilder:
                 page_title_text = page.get("title", f"Page {page_id}")
                 
                 # Item
-                item = ET.SubElement(org, "item")
-                item.set("identifier", f"item-{page_id}")
-                item.set("identifierref", f"resource-{page_id}")
-                item.set("isvisible", "true")
-                
+                item = ET.SubElement(org, "item", {
+                    "identifier": f"item-{page_id}",
+                    "identifierref": f"resource-{page_id}",
+                    "isvisible": "true",
+                })
+
                 item_title = ET.SubElement(item, "title")
                 item_title.text = page_title_text
                 
                 mastery = ET.SubElement(item, "adlcp:masteryscore")
-                mastery.text = str(config.SCORM_MASTERY_SCORE)
+                mastery.text = mastery_val
                 
                 # Resource
-                resource = ET.SubElement(resources, "resource")
-                resource.set("identifier", f"resource-{page_id}")
-                resource.set("type", "webcontent")
-                resource.set("adlcp:scormtype", "sco")
-                resource.set("href", f"page_{page_id}.html")
-                
+                resource = ET.SubElement(resources, "resource", {
+                    "identifier": f"resource-{page_id}",
+                    "type": "webcontent",
+                    "adlcp:scormtype": "sco",
+                    "href": f"page_{page_id}.html",
+                })
+
                 # Files
-                f1 = ET.SubElement(resource, "file")
-                f1.set("href", f"page_{page_id}.html")
-                f2 = ET.SubElement(resource, "file")
-                f2.set("href", "style.css")
-                f3 = ET.SubElement(resource, "file")
-                f3.set("href", "scorm_api.js")
+                ET.SubElement(resource, "file", {"href": f"page_{page_id}.html"})
+                ET.SubElement(resource, "file", {"href": "style.css"})
+                ET.SubElement(resource, "file", {"href": "scorm_api.js"})
 
         # Format XML (#10 — ET.indent instead of minidom)
         ET.indent(manifest, space="  ")
-        xml_str = ET.tostring(manifest, encoding="unicode", xml_declaration=False)
-        return '<?xml version="1.0" encoding="UTF-8"?>\n' + xml_str
+        # tostringlist — без склейки всего документа в один bytes
+        return [b'<?xml version="1.0" encoding="UTF-8"?>\n',
+                *ET.tostringlist(manifest, encoding="utf-8")]
 
     # ------------------------------------------------------------------
     # Рендеринг HTML
     # ------------------------------------------------------------------
 
-    def _render_html(self, course: dict) -> str:
+    def _render_html(self, course: dict) -> TemplateStream:
         """Рендеринг HTML-страницы из Jinja2 шаблона (Legacy Mono-SCO)."""
-        template = self.env.get_template("index.html")
-        return template.render(
+        return self._tpl_index.stream(
             title=course.get("title", "Untitled"),
             description=course.get("description", ""),
             language=course.get("language", config.DEFAULT_COURSE_LANGUAGE),
             pages=course.get("pages", []),
         )
 
-    def _render_page_html(self, course: dict, page: dict, page_idx: int) -> str:
+    def _render_page_html(self, course: dict, page: dict,
+                          page_idx: int) -> TemplateStream:
         """Рендеринг HTML для отдельной страницы (Multi-SCO)."""
-        # Пытаемся использовать page.html, если нет - фоллбэк на index.html
-        try:
-            template = self.env.get_template("page.html")
-        except:
+        if not self._has_page_tpl:
             return self._render_html(course)
-            
-        return template.render(
+
+        return self._tpl_page.stream(
             title=course.get("title", "Untitled"),
             language=course.get("language", config.DEFAULT_COURSE_LANGUAGE),
             page=page,
@@ -234,44 +335,52 @@ class SCORMBuilder:
             total_pages=len(course.get("pages", [])),
         )
 
+    def _write_html(self, zf: zipfile.ZipFile, name: str,
+                    stream: TemplateStream) -> None:
+        """Запись HTML в ZIP по мере рендеринга — строка целиком не собирается."""
+        stream.enable_buffering(_TEMPLATE_BUFFER_SIZE)
+        with zf.open(self._zip_info(zf, name), "w") as f:
+            stream.dump(f, encoding="utf-8")
+
     # ------------------------------------------------------------------
     # Утилиты
     # ------------------------------------------------------------------
 
-    def _read_template_file(self, filename: str) -> str:
-        """Чтение статического файла из папки шаблонов."""
-        path = os.path.join(self.templates_dir, filename)
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
+    def _read_template_file(self, filename: str) -> bytes:
+        """Чтение статического файла из папки шаблонов (уже в UTF-8)."""
+        return _load_static(os.path.join(self.templates_dir, filename))
+
+    def _open_zip(self, stream: IO[bytes]) -> zipfile.ZipFile:
+        """Открытие ZIP-архива на запись в бинарный поток."""
+        return zipfile.ZipFile(stream, "w", self._compression,
+                               compresslevel=self._compresslevel)
 
     @staticmethod
-    def _create_zip(files: dict[str, str], output_path: str) -> None:
-        """Создание ZIP-архива из словаря {filename: content}."""
-        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
-        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for name, content in files.items():
-                zf.writestr(name, content)
+    def _zip_info(zf: zipfile.ZipFile, name: str) -> zipfile.ZipInfo:
+        """ZipInfo с фиксированной датой и методом сжатия архива."""
+        info = zipfile.ZipInfo(name, date_time=_ZIP_DATE_TIME)
+        info.compress_type = zf.compression
+        # Для ZipInfo ZipFile не подставляет свой compresslevel сам
+        # (в 3.13+ _compresslevel — алиас compress_level)
+        info._compresslevel = zf.compresslevel
+        info.external_attr = 0o644 << 16
+        return info
+
+    @classmethod
+    def _write_chunks(cls, zf: zipfile.ZipFile, name: str,
+                      chunks: Iterable[bytes]) -> None:
+        """Потоковая запись в ZIP по кускам — без сборки всех bytes в памяти."""
+        with zf.open(cls._zip_info(zf, name), "w") as f:
+            for chunk in chunks:
+                f.write(chunk)
 
     @staticmethod
     def _slugify(text: str) -> str:
         """Простая транслитерация и slugify для идентификаторов."""
-        translit = {
-            "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e",
-            "ё": "yo", "ж": "zh", "з": "z", "и": "i", "й": "j", "к": "k",
-            "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
-            "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
-            "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y",
-            "ь": "", "э": "e", "ю": "yu", "я": "ya",
-        }
-        result = []
-        for char in text.lower():
-            if char in translit:
-                result.append(translit[char])
-            elif char.isascii() and (char.isalnum() or char in "-_"):
-                result.append(char)
-            elif char in " \t":
-                result.append("-")
-        slug = "".join(result)
+        # Транслитерация и пробелы → дефисы за один проход str.translate (в C)
+        slug = text.lower().translate(_SLUG_TABLE)
+        # Всё, что не ASCII-буква/цифра/-/_, отбрасываем
+        slug = _SLUG_BAD_RE.sub('', slug)
         # Collapse multiple hyphens (#9 — re.sub instead of while loop)
-        slug = re.sub(r'-{2,}', '-', slug)
+        slug = _DASH_RE.sub('-', slug)
         return slug.strip("-") or "course"
@@ -5,6 +5,7 @@
 // ─── State ───
 let lastCourse = null;
 let lastScormFilename = null;
+let lastTaskId = null;  // generation task of lastCourse (null for uploaded JSON)
 
 // ─── Init ───
 document.addEventListener('DOMContentLoaded', () => {
@@ -196,6 +197,7 @@ async function generateCourse() {
             detail_level: document.getElementById('detail-level').value,
             system_prompt: document.getElementById('system-prompt').value.trim(),
             extra_instructions: document.getElementById('extra-instructions').value.trim(),
+            use_cache: document.getElementById('use-cache').checked,
         });
 
         if (!startResult.ok) {
@@ -206,14 +208,15 @@ async function generateCourse() {
             return;
         }
 
-        // Step 2: Poll for status (#12 — real progress)
+        // Step 2: Wait for status (#12 — real progress, pushed via SSE)
         const taskId = startResult.task_id;
-        const pollResult = await pollGeneration(taskId);
+        const pollResult = await streamGeneration(taskId);
 
         hideProgress();
 
         if (pollResult && pollResult.status === 'done') {
             lastCourse = pollResult.course;
+            lastTaskId = taskId;
             lastScormFilename = pollResult.scorm_filename;
             renderPreview(pollResult.course);
             showMsg('action-msg', '✅ SCORM создан: ' + pollResult.scorm_filename, 'ok');
@@ -231,6 +234,32 @@ async function generateCourse() {
     btn.innerHTML = '🤖 Сгенерировать';
 }
 
+/**
+ * Receive generation status via Server-Sent Events until done/error.
+ * Falls back to polling if EventSource is unavailable or the stream breaks.
+ */
+function streamGeneration(taskId) {
+    if (!window.EventSource) return pollGeneration(taskId);
+
+    return new Promise(resolve => {
+        const source = new EventSource(`/api/generate-stream/${taskId}`);
+
+        source.onmessage = (e) => {
+            const status = JSON.parse(e.data);
+            updateProgressBar(status.progress, status.status_text);
+            if (status.status === 'done' || status.status === 'error') {
+                source.close();
+                resolve(status);
+            }
+        };
+
+        source.onerror = () => {
+            source.close();
+            resolve(pollGeneration(taskId));
+        };
+    });
+}
+
 /**
  * Poll generation status until done/error (#4, #12)
  */
@@ -277,6 +306,7 @@ function handleJSONFile(file) {
             document.getElementById('file-drop').classList.add('active');
 
             lastCourse = course;
+            lastTaskId = null;
             await api('/api/generate-from-json', { course });
             renderPreview(course);
             await buildSCORM();
@@ -342,9 +372,25 @@ function renderPreview(course) {
 //  SCORM Build & Upload
 // ═══════════════════════════════════════════
 
+/**
+ * The server prunes finished generation tasks after an hour: build the
+ * course shown on the page from its JSON instead of the task id.
+ */
+async function rebuildFromLastCourse() {
+    lastTaskId = null;
+    const result = await api('/api/build-scorm', { course: lastCourse });
+    if (result.ok) lastScormFilename = result.filename;
+    return result;
+}
+
 async function buildSCORM() {
     try {
-        const result = await api('/api/build-scorm', {});
+        // Task id or the course itself — never the server's shared "last course"
+        let result = await api('/api/build-scorm',
+            lastTaskId ? { task_id: lastTaskId } : { course: lastCourse });
+        if (result.task_expired && lastCourse) {
+            result = await rebuildFromLastCourse();
+        }
         if (result.ok) {
             lastScormFilename = result.filename;
             showMsg('action-msg', '✅ SCORM создан: ' + result.filename, 'ok');
@@ -379,13 +425,21 @@ async function uploadToChamilo() {
     btn.innerHTML = '⏳ Загрузка...';
 
     try {
-        const result = await api('/api/upload', {
+        const upload = () => api('/api/upload', {
+            task_id: lastTaskId,
+            filename: lastScormFilename,
             course_code: courseCode,
             chamilo_url: document.getElementById('chamilo-url').value.trim(),
             chamilo_user: document.getElementById('chamilo-user').value.trim() || 'admin',
             chamilo_password: document.getElementById('chamilo-pass').value.trim(),
         });
 
+        let result = await upload();
+        if (result.task_expired && lastCourse) {
+            const built = await rebuildFromLastCourse();
+            result = built.ok ? await upload() : built;
+        }
+
         if (result.ok) {
             showMsg('action-msg', '🎉 ' + result.message, 'ok');
         } else {
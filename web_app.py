@@ -6,17 +6,43 @@ LLM → SCORM → Chamilo Pipeline — Web UI.
     Откройте http://localhost:5000
 """
 
+import contextlib
+import hashlib
 import json
 import logging
 import os
+import re
+import shutil
 import sys
 import threading
+import time
 import uuid
-
-from flask import Flask, jsonify, request, send_file, send_from_directory
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from flask import (
+    Flask, Response, jsonify, request, send_file, stream_with_context,
+)
+from flask.json.provider import JSONProvider
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from werkzeug.utils import secure_filename
 
 import config
+from chamilo_uploader import ChamiloUploader
+from llm_generator import LLMCourseGenerator, get_openai_client
+from scorm_builder import SCORMBuilder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # optional: falls back to Flask's stdlib JSON provider
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None  # optional: responses go out uncompressed
 
 # ─── Fix Windows console encoding ───
 if hasattr(sys.stdout, "reconfigure"):
@@ -28,24 +54,191 @@ if hasattr(sys.stderr, "reconfigure"):
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
+# Oversized bodies are rejected (413) before request.json parses them;
+# course JSON uploads are the largest legitimate payload
+app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
+# Behind Apache/lighttpd the web server streams files itself (sendfile(2))
+app.config["USE_X_SENDFILE"] = config.USE_X_SENDFILE
+
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (C encoder/decoder)."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # orjson bytes go straight into the body — no str decode/encode
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+            mimetype="application/json",
+        )
+
+
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
+# gzip/br for JSON and static text (course JSON compresses ~5-10x).
+# /static is served via send_file (a streamed response), so streams must
+# stay enabled; the mimetype list keeps SSE (text/event-stream) and the
+# ZIP downloads out of the compressor
+if Compress is not None:
+    app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+    app.config["COMPRESS_MIN_SIZE"] = 1024
+    app.config["COMPRESS_STREAMS"] = True
+    app.config["COMPRESS_MIMETYPES"] = [
+        "application/json", "application/javascript", "text/javascript",
+        "text/css", "text/html",
+    ]
+    if config.USE_X_SENDFILE:
+        # send_file answers with an empty body + X-Sendfile; compressing it
+        # would label the raw file Content-Encoding: gzip. Files are left
+        # to the web server (mod_deflate), only JSON is compressed here
+        app.config["COMPRESS_MIMETYPES"] = ["application/json"]
+    Compress(app)
+
+# flask-compress appends ":<algorithm>" to the ETag of compressed
+# responses; strip it from If-None-Match so generate-status and /static
+# still recognise their own ETags and answer 304
+_COMPRESS_ETAG_SUFFIX_RE = re.compile(r':(?:br|gzip|deflate|zstd)"')
+
+
+@app.before_request
+def strip_compress_etag_suffix():
+    if_none_match = request.environ.get("HTTP_IF_NONE_MATCH")
+    if if_none_match and ":" in if_none_match:
+        request.environ["HTTP_IF_NONE_MATCH"] = (
+            _COMPRESS_ETAG_SUFFIX_RE.sub('"', if_none_match)
+        )
+
+
+def _json_bytes(obj) -> bytes:
+    """Serialize to UTF-8 JSON bytes with the app's JSON provider."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return app.json.dumps(obj).encode("utf-8")
 
 # In-memory state
 _state = {
     "last_course_json": None,
     "last_scorm_path": None,
 }
+# gthread workers mutate _state from several threads
+_state_lock = threading.Lock()
 
 # Async tasks store (#4)
 _tasks = {}
+_tasks_lock = threading.Lock()
+# Notified on every task update — wakes /api/generate-stream listeners
+_tasks_cond = threading.Condition(_tasks_lock)
+# Finished tasks (with their course JSON) are dropped after this many seconds
+_TASK_TTL = 3600
+
+# Shared HTTP connection pool — keep-alive to the same Chamilo/LLM hosts
+# instead of a new TCP/TLS handshake per request
+_http_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50)
+_http = requests.Session()
+_http.mount("http://", _http_adapter)
+_http.mount("https://", _http_adapter)
+# Stateless probes only: don't let one user's cookies leak into another probe
+_http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+# Cached logged-in Chamilo sessions get their own pool with retries on
+# transient errors (connection tests above stay fail-fast)
+_chamilo_adapter = HTTPAdapter(
+    pool_connections=10, pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.3),
+)
+# (url, user, password hash) -> {"session", "lock"}, oldest first
+_chamilo_sessions = {}
+_chamilo_sessions_lock = threading.Lock()
+_CHAMILO_SESSIONS_MAX = 32
+
+# Serializes .env writes + reload in save_settings
+_settings_lock = threading.Lock()
+
+# Chamilo course code patterns (user portal links / admin course list);
+# bytes patterns run on resp.content, skipping the UTF-8 decode
+_COURSE_RE = re.compile(rb'/courses/([A-Z0-9_]+)/index\.php', re.IGNORECASE)
+_CODE_RE = re.compile(rb'course_code=([A-Z0-9_]+)', re.IGNORECASE)
+
+# /api/generate input limits
+_GEN_TOPIC_MAX = 500
+_GEN_PROMPT_MAX = 4000
+_GEN_DETAIL_LEVELS = ("brief", "normal", "detailed", "expert")
+
+# Chamilo course list cache: (url, user, password hash) -> (timestamp, courses),
+# oldest first; keys come from request bodies, so the size is capped
+_courses_cache = {}
+_courses_cache_lock = threading.Lock()
+_COURSES_TTL = 300
+_COURSES_MAX = 64
+
+# Open /api/generate-stream connections, capped below the server's thread
+# count so streams can't starve static files and status polls
+_sse_slots = threading.BoundedSemaphore(max(1, config.SSE_MAX_STREAMS))
+
+# Stateless and thread-safe — one builder (and its templates) for all builds
+_scorm_builder = SCORMBuilder()
+
+# Bounded worker pool for course generation — no thread per request;
+# extra requests wait in the pool queue
+_generate_pool = ThreadPoolExecutor(
+    max_workers=config.GENERATE_WORKERS, thread_name_prefix="generate"
+)
 
 
 # ═══════════════════════════════════════════
 #  Static Pages
 # ═══════════════════════════════════════════
 
+# Local asset URLs in index.html get a ?v=<version> query, so a deploy
+# changes the URL and long-lived caching of /static is safe
+_ASSET_URL_RE = re.compile(r'((?:href|src)="/static/[\w.-]+\.(?:js|css))"')
+_STATIC_MAX_AGE = 365 * 24 * 3600
+# (version, rendered index.html)
+_index_page = (None, None)
+
+
+def _static_version() -> str:
+    """Newest mtime in static/ — changes whenever an asset is redeployed."""
+    newest = max(entry.stat().st_mtime_ns
+                 for entry in os.scandir(app.static_folder) if entry.is_file())
+    return format(newest, "x")
+
+
 @app.route("/")
 def index():
-    return send_from_directory("static", "index.html")
+    global _index_page
+    version = _static_version()
+    page = _index_page
+    if page[0] != version:
+        with open(os.path.join(app.static_folder, "index.html"),
+                  encoding="utf-8") as f:
+            html = f.read()
+        page = (version, _ASSET_URL_RE.sub(rf'\1?v={version}"', html))
+        _index_page = page
+
+    resp = Response(page[1], mimetype="text/html")
+    resp.set_etag(version)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
+@app.after_request
+def add_static_cache(resp):
+    # Versioned URLs never change content; bare ones keep Flask's no-cache
+    # (revalidation via ETag)
+    if (request.path.startswith("/static/") and "v" in request.args
+            and resp.status_code in (200, 304)):
+        resp.headers["Cache-Control"] = (
+            f"public, max-age={_STATIC_MAX_AGE}, immutable"
+        )
+    return resp
 
 
 # ═══════════════════════════════════════════
@@ -57,7 +250,7 @@ def get_settings():
     """Return current .env settings (passwords masked)."""
     cfg = config.get_config()
 
-    return jsonify({
+    resp = jsonify({
         "chamilo_url": cfg["CHAMILO_URL"],
         "chamilo_user": cfg["CHAMILO_USER"],
         "chamilo_password": "••••" if cfg["CHAMILO_PASSWORD"] else "",
@@ -65,6 +258,9 @@ def get_settings():
         "llm_model": cfg["OPENAI_MODEL"],
         "llm_api_key": "••••" if cfg["OPENAI_API_KEY"] else "",
     })
+    # ETag → 304 on repeat loads while settings are unchanged
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 
 @app.route("/api/settings", methods=["POST"])
@@ -90,24 +286,92 @@ def save_settings():
     if data.get("chamilo_password") and data["chamilo_password"] != "••••":
         lines.append(f"CHAMILO_PASSWORD={data['chamilo_password']}\n")
 
-    with open(env_path, "w", encoding="utf-8") as f:
-        f.writelines(lines)
+    # Atomic replace: a crash mid-write never leaves a truncated .env, and
+    # the lock keeps concurrent saves from interleaving write + reload
+    with _settings_lock:
+        tmp_path = env_path + ".tmp"
+        # .env holds secrets: a new file is owner-only, an existing one
+        # keeps its mode (e.g. an admin's chmod 600) across the replace
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        if os.path.exists(env_path):
+            shutil.copymode(env_path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, env_path)
 
-    # Reload dotenv
-    try:
-        from dotenv import load_dotenv
-        load_dotenv(override=True)
-    except ImportError:
-        pass
+        # Reload dotenv
+        try:
+            from dotenv import load_dotenv
+            load_dotenv(env_path, override=True)
+        except ImportError:
+            pass
 
+    invalidate_caches()
     logger.info("Settings saved to .env")
     return jsonify({"ok": True})
 
 
+def invalidate_caches():
+    """Drop cached data that depends on saved settings."""
+    with _courses_cache_lock:
+        _courses_cache.clear()
+    config.bump_version()
+
+
 # ═══════════════════════════════════════════
 #  Connection Tests
 # ═══════════════════════════════════════════
 
+def _new_session(adapter: HTTPAdapter = _http_adapter) -> requests.Session:
+    """Session with its own cookies (Chamilo login) on the shared pool."""
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@contextlib.contextmanager
+def _chamilo_session(url: str, user: str, password: str, fresh: bool = False):
+    """Logged-in Chamilo session, reused across requests (keep-alive + cookies).
+
+    Yields (session, reused). A requests.Session is not meant for concurrent
+    use, so the entry's lock is held for the whole block: requests with the
+    same credentials take turns and share one login instead of racing.
+    reused=False means the session was just logged in; fresh=True forces
+    that (expired cookie).
+    """
+    key = (url, user, hashlib.sha256(password.encode()).hexdigest())
+    with _chamilo_sessions_lock:
+        entry = _chamilo_sessions.pop(key, None)
+        if entry is None:
+            entry = {"session": None, "lock": threading.Lock()}
+        _chamilo_sessions[key] = entry  # LRU tail
+        # Evicted entries are only dropped, not closed: close() would also
+        # close the shared adapter, and a holder may still be using them
+        while len(_chamilo_sessions) > _CHAMILO_SESSIONS_MAX:
+            del _chamilo_sessions[next(iter(_chamilo_sessions))]
+
+    with entry["lock"]:
+        reused = entry["session"] is not None and not fresh
+        if not reused:
+            entry["session"] = None
+            session = _new_session(_chamilo_adapter)
+            session.get(f"{url}/index.php", timeout=10)
+            session.post(f"{url}/index.php", data={
+                "login": user, "password": password, "submitAuth": "1",
+            }, timeout=10, allow_redirects=True)
+            entry["session"] = session
+        yield entry["session"], reused
+
+
+def _drop_chamilo_session(url: str, user: str, password: str) -> None:
+    key = (url, user, hashlib.sha256(password.encode()).hexdigest())
+    with _chamilo_sessions_lock:
+        _chamilo_sessions.pop(key, None)
+
+
 @app.route("/api/test-chamilo", methods=["POST"])
 def test_chamilo():
     """Test Chamilo LMS connection and login."""
@@ -121,23 +385,40 @@ def test_chamilo():
         return jsonify({"ok": False, "error": "URL не указан"})
 
     try:
-        import requests as req
-        # Test connectivity
-        resp = req.get(f"{url}/index.php", timeout=10)
+        # Test connectivity + get session cookie. The login page is read in
+        # full so the connection goes back to the pool for the POST below
+        session = _new_session()
+        resp = session.get(f"{url}/index.php", timeout=10)
         if resp.status_code != 200:
             return jsonify({"ok": False, "error": f"HTTP {resp.status_code}"})
 
-        # Test login
-        session = req.Session()
-        session.get(f"{url}/index.php", timeout=10)
-
+        # Test login — on success Chamilo answers 302/303 to user_portal.php,
+        # so the Location header decides without downloading the portal page
         resp = session.post(f"{url}/index.php", data={
             "login": user,
             "password": password,
             "submitAuth": "1",
-        }, timeout=10, allow_redirects=True)
+        }, timeout=10, allow_redirects=False)
 
-        if "logout" in resp.text.lower() or user.lower() in resp.text.lower():
+        location = resp.headers.get("Location", "")
+        if resp.status_code in (302, 303) and "user_portal" in location:
+            logged_in = True
+        elif resp.is_redirect and "loginFailed" in location:
+            logged_in = False
+        else:
+            # Any other redirect (e.g. http → https): follow it, then check
+            # the final page
+            for resp in session.resolve_redirects(resp, resp.request, timeout=10):
+                pass
+            # Byte scan: no UTF-8 decode of the page, lowered once
+            body = resp.content.lower()
+            logged_in = b"logout" in body
+            if not logged_in:
+                # bytes.lower() is ASCII-only — non-ASCII logins need the text
+                logged_in = (user.lower().encode() in body if user.isascii()
+                             else user.lower() in resp.text.lower())
+
+        if logged_in:
             return jsonify({"ok": True, "message": f"Подключено как {user}"})
         else:
             return jsonify({"ok": False, "error": "Неверный логин/пароль"})
@@ -159,18 +440,16 @@ def test_llm():
         return jsonify({"ok": False, "error": "Укажите URL сервера или API ключ"})
 
     try:
-        import requests as req
-
         if base_url:
             # Ollama / LM Studio / vLLM
             # Strip /v1 to get base ollama URL
             ollama_base = base_url.replace("/v1", "").rstrip("/")
-            resp = req.get(ollama_base, timeout=10)
+            resp = _http.get(ollama_base, timeout=10)
             if "ollama" in resp.text.lower() or resp.status_code == 200:
                 # Try to list models
                 models = []
                 try:
-                    resp2 = req.get(f"{ollama_base}/api/tags", timeout=10)
+                    resp2 = _http.get(f"{ollama_base}/api/tags", timeout=10)
                     if resp2.status_code == 200:
                         data2 = resp2.json()
                         models = [m["name"] for m in data2.get("models", [])]
@@ -191,8 +470,7 @@ def test_llm():
                 return jsonify({"ok": False, "error": "Не OpenAI-совместимый сервер"})
         else:
             # OpenAI API
-            from openai import OpenAI
-            client = OpenAI(api_key=api_key)
+            client = get_openai_client(api_key)
             models = client.models.list()
             return jsonify({"ok": True, "message": "OpenAI API подключен"})
 
@@ -201,6 +479,38 @@ def test_llm():
         return jsonify({"ok": False, "error": str(e)[:200]})
 
 
+def _course_codes(pattern: re.Pattern, content: bytes) -> list:
+    """Unique course codes in page order (codes are ASCII by the pattern)."""
+    return list(dict.fromkeys(
+        m.group(1).decode("ascii") for m in pattern.finditer(content)
+    ))
+
+
+def _courses_cache_get(key: tuple):
+    """Cached course list, or None; expired entries are dropped on read."""
+    with _courses_cache_lock:
+        cached = _courses_cache.get(key)
+        if cached is None:
+            return None
+        if time.time() - cached[0] >= _COURSES_TTL:
+            del _courses_cache[key]
+            return None
+        return cached[1]
+
+
+def _courses_cache_put(key: tuple, courses: list) -> None:
+    now = time.time()
+    with _courses_cache_lock:
+        _courses_cache.pop(key, None)
+        _courses_cache[key] = (now, courses)
+        # Insertion order is age order: trim expired and overflow from the head
+        while _courses_cache:
+            oldest_key, (ts, _) = next(iter(_courses_cache.items()))
+            if len(_courses_cache) <= _COURSES_MAX and now - ts < _COURSES_TTL:
+                break
+            del _courses_cache[oldest_key]
+
+
 @app.route("/api/chamilo-courses", methods=["POST"])
 def chamilo_courses():
     """Get list of courses from Chamilo."""
@@ -214,25 +524,32 @@ def chamilo_courses():
     if not url:
         return jsonify({"ok": False, "courses": []})
 
-    try:
-        import re
-        import requests as req
-        session = req.Session()
-        session.get(f"{url}/index.php", timeout=10)
-        session.post(f"{url}/index.php", data={
-            "login": user, "password": password, "submitAuth": "1",
-        }, timeout=10, allow_redirects=True)
-
-        # Get courses
-        resp = session.get(f"{url}/user_portal.php", timeout=10)
-        matches = re.findall(r'/courses/([A-Z0-9_]+)/index\.php', resp.text, re.IGNORECASE)
-        courses = list(set(matches))
-
-        if not courses:
-            resp = session.get(f"{url}/main/admin/course_list.php", timeout=10)
-            matches = re.findall(r'course_code=([A-Z0-9_]+)', resp.text, re.IGNORECASE)
-            courses = list(set(matches))
+    cache_key = (url, user, hashlib.sha256(password.encode()).hexdigest())
+    cached = _courses_cache_get(cache_key)
+    if cached is not None:
+        return jsonify({"ok": True, "courses": cached})
 
+    try:
+        # Second pass re-logs in, but only if the first one reused a cached
+        # session — its cookie may have expired. A fresh login that finds
+        # nothing will not find more on a repeat
+        for fresh in (False, True):
+            with _chamilo_session(url, user, password, fresh=fresh) as (session, reused):
+                # Get courses
+                resp = session.get(f"{url}/user_portal.php", timeout=10)
+                courses = _course_codes(_COURSE_RE, resp.content)
+
+                if not courses:
+                    resp = session.get(f"{url}/main/admin/course_list.php", timeout=10)
+                    courses = _course_codes(_CODE_RE, resp.content)
+            if courses or not reused:
+                break
+
+        # Empty list usually means failed login — don't cache it
+        if courses:
+            _courses_cache_put(cache_key, courses)
+        else:
+            _drop_chamilo_session(url, user, password)
         return jsonify({"ok": True, "courses": courses})
 
     except Exception as e:
@@ -248,20 +565,19 @@ def _generate_bg(task_id: str, params: dict):
     """Background thread for course generation."""
     task = _tasks[task_id]
     try:
-        task["progress"] = 5
-        task["status_text"] = "Подключение к LLM..."
+        _update_task(task, progress=5, status_text="Подключение к LLM...")
 
-        from llm_generator import LLMCourseGenerator
         generator = LLMCourseGenerator(
             api_key=params.get("api_key") or None,
             model=params.get("model") or None,
             base_url=params.get("base_url") or None,
         )
 
-        task["progress"] = 15
-        task["status_text"] = "Генерация курса через ИИ..."
+        _update_task(task, progress=15, status_text="Генерация курса через ИИ...")
 
-        course = generator.generate_course(
+        # Every result is stored in the cache; use_cache only allows reading it
+        course = generator.generate_course_cached(
+            read_cache=params.get("use_cache", False),
             topic=params["topic"],
             num_pages=params.get("pages", 3),
             language=params.get("lang", "ru"),
@@ -274,40 +590,139 @@ def _generate_bg(task_id: str, params: dict):
             extra_instructions=params.get("extra_instructions") or None,
         )
 
-        task["progress"] = 70
-        task["status_text"] = "Сборка SCORM-пакета..."
+        _update_task(task, progress=70, status_text="Сборка SCORM-пакета...")
 
         # Auto-build SCORM
-        from scorm_builder import SCORMBuilder
-        builder = SCORMBuilder()
-        scorm_path = builder.build(course)
-
-        task["progress"] = 100
-        task["status_text"] = "Готово!"
-        task["status"] = "done"
-        task["course"] = course
-        task["scorm_path"] = scorm_path
-        task["scorm_filename"] = os.path.basename(scorm_path)
+        scorm_path = _scorm_builder.build(course)
+
+        _update_task(
+            task,
+            progress=100,
+            status_text="Готово!",
+            status="done",
+            course=course,
+            scorm_path=scorm_path,
+            scorm_filename=os.path.basename(scorm_path),
+            finished_at=time.time(),
+        )
 
         # Update global state for backward compat
-        _state["last_course_json"] = course
-        _state["last_scorm_path"] = scorm_path
+        with _state_lock:
+            _state["last_course_json"] = course
+            _state["last_scorm_path"] = scorm_path
 
         logger.info("Course generated: %s", course.get("title", "?"))
 
     except Exception as e:
-        task["status"] = "error"
-        task["progress"] = 0
         err = str(e)
         if "insufficient_quota" in err:
             err = "Квота OpenAI исчерпана. Проверьте баланс."
         elif "Connection" in err or "connect" in err.lower():
             err = "Не удалось подключиться к LLM-серверу."
-        task["error"] = err[:300]
-        task["status_text"] = "Ошибка"
+        _update_task(
+            task,
+            status="error",
+            progress=0,
+            error=err[:300],
+            status_text="Ошибка",
+            finished_at=time.time(),
+        )
         logger.error("Course generation failed: %s", e)
 
 
+def _update_task(task: dict, **fields):
+    """Apply a task update atomically and wake stream listeners."""
+    with _tasks_cond:
+        task.update(fields)
+        task["version"] += 1
+        _tasks_cond.notify_all()
+
+
+def _task_payload(task: dict) -> dict:
+    """Public JSON view of a task (shared by polling and SSE)."""
+    result = {
+        "ok": True,
+        "status": task["status"],
+        "progress": task["progress"],
+        "status_text": task["status_text"],
+    }
+
+    if task["status"] == "done":
+        result["course"] = task["course"]
+        result["scorm_filename"] = task["scorm_filename"]
+    elif task["status"] == "error":
+        result["error"] = task["error"]
+
+    return result
+
+
+def _task_body(task: dict) -> bytes:
+    """Serialized _task_payload, cached per task version (caller holds _tasks_lock).
+
+    A finished task's course JSON is encoded once, not on every poll.
+    """
+    cached = task.get("body")
+    if cached is None or cached[0] != task["version"]:
+        cached = (task["version"], _json_bytes(_task_payload(task)))
+        task["body"] = cached
+    return cached[1]
+
+
+def _prune_tasks():
+    """Drop finished tasks older than _TASK_TTL (caller holds _tasks_lock)."""
+    cutoff = time.time() - _TASK_TTL
+    expired = [tid for tid, t in _tasks.items()
+               if t["finished_at"] is not None and t["finished_at"] < cutoff]
+    for tid in expired:
+        del _tasks[tid]
+
+
+def _bounded(data: dict, key: str, default, cast, low, high):
+    """Read data[key] as cast(...) and check low <= value <= high."""
+    try:
+        value = cast(data.get(key, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"Некорректное значение параметра {key}")
+    if not low <= value <= high:
+        raise ValueError(f"Параметр {key}: допустимо от {low} до {high}")
+    return value
+
+
+def _text(data: dict, key: str, default: str = "", max_len: int = 200) -> str:
+    """Read data[key] as a string of at most max_len characters."""
+    value = data.get(key) or default
+    if not isinstance(value, str):
+        raise ValueError(f"Некорректное значение параметра {key}")
+    if len(value) > max_len:
+        raise ValueError(f"Параметр {key}: не длиннее {max_len} символов")
+    return value
+
+
+def _parse_generate_params(data: dict) -> dict:
+    """Validate /api/generate input (raises ValueError with a UI message)."""
+    params = {
+        "topic": _text(data, "topic", max_len=_GEN_TOPIC_MAX),
+        "pages": _bounded(data, "pages", 3, int, 1, 20),
+        "lang": _text(data, "lang", "ru", max_len=10),
+        "base_url": _text(data, "base_url", max_len=500),
+        "model": _text(data, "model", max_len=200),
+        "api_key": _text(data, "api_key", max_len=500),
+        "temperature": _bounded(data, "temperature", 0.7, float, 0.0, 2.0),
+        "max_tokens": _bounded(data, "max_tokens", 4096, int, 256, 16384),
+        "blocks_per_page": _bounded(data, "blocks_per_page", 3, int, 1, 10),
+        "questions_per_page": _bounded(data, "questions_per_page", 1, int, 0, 5),
+        "detail_level": _text(data, "detail_level", "normal", max_len=20),
+        "system_prompt": _text(data, "system_prompt", max_len=_GEN_PROMPT_MAX),
+        "extra_instructions": _text(data, "extra_instructions",
+                                    max_len=_GEN_PROMPT_MAX),
+        # Reuse a course generated earlier with identical parameters
+        "use_cache": bool(data.get("use_cache")),
+    }
+    if params["detail_level"] not in _GEN_DETAIL_LEVELS:
+        raise ValueError("Некорректный уровень детальности")
+    return params
+
+
 @app.route("/api/generate", methods=["POST"])
 def generate_course():
     """Generate course via LLM (async, returns task_id)."""
@@ -317,35 +732,28 @@ def generate_course():
     if not topic:
         return jsonify({"ok": False, "error": "Укажите тему курса"})
 
-    task_id = str(uuid.uuid4())
-    _tasks[task_id] = {
-        "status": "running",
-        "progress": 0,
-        "status_text": "Запуск...",
-        "course": None,
-        "scorm_path": None,
-        "scorm_filename": None,
-        "error": None,
-    }
-
-    params = {
-        "topic": topic,
-        "pages": int(data.get("pages", 3)),
-        "lang": data.get("lang", "ru"),
-        "base_url": data.get("base_url", ""),
-        "model": data.get("model", ""),
-        "api_key": data.get("api_key", ""),
-        "temperature": float(data.get("temperature", 0.7)),
-        "max_tokens": int(data.get("max_tokens", 4096)),
-        "blocks_per_page": int(data.get("blocks_per_page", 3)),
-        "questions_per_page": int(data.get("questions_per_page", 1)),
-        "detail_level": data.get("detail_level", "normal"),
-        "system_prompt": data.get("system_prompt", ""),
-        "extra_instructions": data.get("extra_instructions", ""),
-    }
+    # Reject out-of-range requests before any LLM call
+    try:
+        params = _parse_generate_params(data)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
-    thread = threading.Thread(target=_generate_bg, args=(task_id, params), daemon=True)
-    thread.start()
+    task_id = str(uuid.uuid4())
+    with _tasks_lock:
+        _prune_tasks()
+        _tasks[task_id] = {
+            "status": "running",
+            "progress": 0,
+            "status_text": "Запуск...",
+            "course": None,
+            "scorm_path": None,
+            "scorm_filename": None,
+            "error": None,
+            "finished_at": None,
+            "version": 0,
+        }
+
+    _generate_pool.submit(_generate_bg, task_id, params)
 
     return jsonify({"ok": True, "task_id": task_id})
 
@@ -357,20 +765,69 @@ def generate_status(task_id):
     if not task:
         return jsonify({"ok": False, "error": "Задача не найдена"}), 404
 
-    result = {
-        "ok": True,
-        "status": task["status"],
-        "progress": task["progress"],
-        "status_text": task["status_text"],
-    }
+    # Task version as ETag: a client that already has this state gets a
+    # 304 instead of the (possibly large) course JSON again
+    with _tasks_lock:
+        etag = f"{task_id}-{task['version']}"
+        if request.if_none_match.contains(etag):
+            body = None
+        else:
+            body = _task_body(task)
 
-    if task["status"] == "done":
-        result["course"] = task["course"]
-        result["scorm_filename"] = task["scorm_filename"]
-    elif task["status"] == "error":
-        result["error"] = task["error"]
+    if body is None:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
+
+
+@app.route("/api/generate-stream/<task_id>")
+def generate_stream(task_id):
+    """Push generation progress as Server-Sent Events (no polling)."""
+    if task_id not in _tasks:
+        return jsonify({"ok": False, "error": "Задача не найдена"}), 404
 
-    return jsonify(result)
+    # Each open stream pins a server thread; past the cap the client gets
+    # 503 and EventSource.onerror falls back to polling
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({"ok": False, "error": "Слишком много потоков"}), 503
+
+    def events():
+        seen = None
+        while True:
+            with _tasks_cond:
+                _tasks_cond.wait_for(
+                    lambda: task_id not in _tasks
+                    or _tasks[task_id]["version"] != seen,
+                    timeout=15,
+                )
+                task = _tasks.get(task_id)
+                if task is None:
+                    return
+                body = None
+                if task["version"] != seen:
+                    seen = task["version"]
+                    body = _task_body(task)
+                    status = task["status"]
+
+            if body is None:
+                # Comment line keeps proxies from closing an idle stream
+                yield b": keep-alive\n\n"
+                continue
+            yield b"data: " + body + b"\n\n"
+            if status != "running":
+                return
+
+    resp = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs when the server closes the response, even if never iterated
+    resp.call_on_close(_sse_slots.release)
+    return resp
 
 
 @app.route("/api/generate-from-json", methods=["POST"])
@@ -381,7 +838,8 @@ def generate_from_json():
     if not course:
         return jsonify({"ok": False, "error": "JSON не предоставлен"})
 
-    _state["last_course_json"] = course
+    with _state_lock:
+        _state["last_course_json"] = course
     return jsonify({"ok": True, "course": course})
 
 
@@ -389,18 +847,53 @@ def generate_from_json():
 #  SCORM Build & Upload
 # ═══════════════════════════════════════════
 
+def _task_expired():
+    """404 for a pruned or unknown task; the UI resends its course on task_expired."""
+    return jsonify({
+        "ok": False,
+        "task_expired": True,
+        "error": "Задача устарела — сгенерируйте курс заново или загрузите JSON",
+    }), 404
+
+
+def _finished_task(task_id: str):
+    """Done task by id, or None (lets concurrent users address their own job)."""
+    with _tasks_lock:
+        task = _tasks.get(task_id)
+        if task is None or task["status"] != "done":
+            return None
+        return task
+
+
 @app.route("/api/build-scorm", methods=["POST"])
 def build_scorm():
-    """Build SCORM package from last generated course."""
-    course = _state.get("last_course_json")
+    """Build SCORM package from a generation task or the last loaded course."""
+    data = request.get_json(silent=True) or {}
+    task_id = data.get("task_id")
+    task = None
+    if task_id:
+        task = _finished_task(task_id)
+        if task is None:
+            return _task_expired()
+        course = task["course"]
+    elif data.get("course") is not None:
+        # The client's own course — no shared state between users
+        course = data["course"]
+        if not isinstance(course, dict):
+            return jsonify({"ok": False, "error": "Некорректный JSON курса"}), 400
+    else:
+        with _state_lock:
+            course = _state.get("last_course_json")
     if not course:
         return jsonify({"ok": False, "error": "Сначала сгенерируйте курс"})
 
     try:
-        from scorm_builder import SCORMBuilder
-        builder = SCORMBuilder()
-        path = builder.build(course)
-        _state["last_scorm_path"] = path
+        path = _scorm_builder.build(course)
+        if task is not None:
+            _update_task(task, scorm_path=path,
+                         scorm_filename=os.path.basename(path))
+        with _state_lock:
+            _state["last_scorm_path"] = path
 
         filename = os.path.basename(path)
         return jsonify({"ok": True, "path": path, "filename": filename})
@@ -416,14 +909,26 @@ def upload_to_chamilo():
     cfg = config.get_config()
 
     data = request.json
-    scorm_path = _state.get("last_scorm_path")
+    task_id = data.get("task_id")
+    if task_id:
+        task = _finished_task(task_id)
+        if task is None:
+            return _task_expired()
+        scorm_path = task["scorm_path"]
+    elif data.get("filename"):
+        # Package built earlier by /api/build-scorm for this client
+        scorm_path = _output_file(data["filename"])
+        if scorm_path is None or not scorm_path.endswith(".zip"):
+            return jsonify({"ok": False, "error": "SCORM-пакет не найден, соберите его заново"}), 404
+    else:
+        with _state_lock:
+            scorm_path = _state.get("last_scorm_path")
     if not scorm_path:
         return jsonify({"ok": False, "error": "Сначала соберите SCORM"})
 
     course_code = data.get("course_code", "")
 
     try:
-        from chamilo_uploader import ChamiloUploader
         uploader = ChamiloUploader(
             chamilo_url=data.get("chamilo_url") or cfg["CHAMILO_URL"],
             username=data.get("chamilo_user") or cfg["CHAMILO_USER"],
@@ -440,15 +945,44 @@ def upload_to_chamilo():
         return jsonify({"ok": False, "error": str(e)[:300]})
 
 
+def _output_file(filename: str):
+    """Real path of a file directly in OUTPUT_DIR, or None."""
+    filename = secure_filename(filename)
+    if not filename:
+        return None
+    # Resolve symlinks: the file must really live inside OUTPUT_DIR
+    output_dir = os.path.realpath(config.OUTPUT_DIR)
+    path = os.path.realpath(os.path.join(output_dir, filename))
+    if not path.startswith(output_dir + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
 @app.route("/api/download/<filename>")
 def download_file(filename):
     """Download generated SCORM ZIP (#17 — secure_filename)."""
     filename = secure_filename(filename)
     if not filename:
         return jsonify({"error": "Invalid filename"}), 400
-    return send_from_directory(
-        config.OUTPUT_DIR, filename, as_attachment=True
-    )
+
+    path = _output_file(filename)
+    if path is None:
+        return jsonify({"error": "Not found"}), 404
+
+    # Behind nginx: hand the transfer to the web server (sendfile, no worker)
+    if config.SCORM_ACCEL_REDIRECT:
+        resp = Response(mimetype="application/zip")
+        prefix = config.SCORM_ACCEL_REDIRECT.rstrip("/")
+        resp.headers["X-Accel-Redirect"] = f"{prefix}/{filename}"
+        resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        return resp
+
+    # conditional: Range resumes and 304 on repeat downloads. A rebuild of
+    # the same course reuses the file name, so no max-age: the browser must
+    # revalidate (ETag / Last-Modified) instead of serving a stale ZIP
+    return send_file(path, as_attachment=True, download_name=filename,
+                     conditional=True, etag=True, max_age=0,
+                     last_modified=os.path.getmtime(path))
 
 
 # ═══════════════════════════════════════════
@@ -0,0 +1,16 @@
+"""
+LLM → SCORM → Chamilo Pipeline — WSGI entry point (production).
+
+Запуск:
+    gunicorn -c gunicorn_conf.py wsgi:app
+
+Один процесс: задачи генерации хранятся в памяти процесса, поэтому
+параллелизм даётся потоками (--threads), а не воркерами (-w).
+"""
+
+import logging
+
+from web_app import app  # noqa: F401
+
+logging.basicConfig(level=logging.INFO,
+                    format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")